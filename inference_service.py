@@ -0,0 +1,150 @@
+"""
+Ray Serve deployment hosting the summarization and sentiment-analysis models.
+
+A single replica serves every web worker, so the weights are loaded once and
+concurrent requests are coalesced into batched forward passes.
+Start it with: serve run --name inference inference_service:app
+"""
+import os
+import psutil
+
+# Pin OpenMP to the physical core count (hyperthreads don't speed up the matmuls);
+# this must happen before the inference runtimes are imported
+NUM_THREADS = int(os.getenv("OMP_NUM_THREADS", psutil.cpu_count(logical=False) or os.cpu_count() or 1))
+os.environ["OMP_NUM_THREADS"] = str(NUM_THREADS)
+
+import shutil
+import asyncio
+import onnxruntime
+import torch
+from contextlib import contextmanager
+from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTModelForSequenceClassification, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig
+from ray import serve
+from transformers import AutoTokenizer, pipeline
+
+# Inference backend: "onnx" (int8 ONNX Runtime) or "torch" (bfloat16 + torch.compile)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "onnx")
+
+# Directory holding the exported and quantized ONNX models
+ONNX_MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+
+def load_quantized_model(model_class, model_id, revision):
+    """
+    Loads an int8 dynamically quantized ONNX Runtime model.
+    The model is exported to ONNX and quantized on first use, then reused from disk.
+    """
+    model_dir = os.path.join(ONNX_MODELS_DIR, model_id.replace("/", "--"))
+    int8_dir = os.path.join(model_dir, "int8")
+
+    if not os.path.isdir(int8_dir):
+        # Build in a scratch directory and move it into place only once every graph is written,
+        # so an interrupted run is redone instead of being trusted on the next start
+        build_dir = os.path.join(model_dir, "build")
+        fp32_dir = os.path.join(build_dir, "fp32")
+        quantized_dir = os.path.join(build_dir, "int8")
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.makedirs(quantized_dir, exist_ok=True)
+
+        model_class.from_pretrained(model_id, revision=revision, export=True).save_pretrained(fp32_dir)
+        AutoTokenizer.from_pretrained(model_id, revision=revision).save_pretrained(fp32_dir)
+
+        # Quantize every ONNX graph (the seq2seq export has separate encoder/decoder graphs)
+        quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+        for file_name in os.listdir(fp32_dir):
+            if file_name.endswith(".onnx"):
+                quantizer = ORTQuantizer.from_pretrained(fp32_dir, file_name=file_name)
+                quantizer.quantize(save_dir=quantized_dir, quantization_config=quantization_config, file_suffix="")
+            else:
+                shutil.copy(os.path.join(fp32_dir, file_name), quantized_dir)
+
+        os.replace(quantized_dir, int8_dir)
+        shutil.rmtree(build_dir)
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.intra_op_num_threads = NUM_THREADS
+    model = model_class.from_pretrained(int8_dir, session_options=session_options)
+    tokenizer = AutoTokenizer.from_pretrained(int8_dir)
+    return model, tokenizer
+
+def load_pipeline(task, model_class, model_id, revision):
+    """ Builds a Hugging Face pipeline for the configured inference backend. """
+    if INFERENCE_BACKEND == "torch":
+        nlp = pipeline(task, model=model_id, revision=revision, torch_dtype=torch.bfloat16, truncation=True)
+        # Compile forward() rather than the module so generate() also runs the compiled graph
+        nlp.model.forward = torch.compile(nlp.model.forward, mode="reduce-overhead")
+        return nlp
+    model, tokenizer = load_quantized_model(model_class, model_id, revision)
+    return pipeline(task, model=model, tokenizer=tokenizer, truncation=True)
+
+@contextmanager
+def inference_context():
+    """ Context manager that model calls run under; enables bfloat16 autocast on the torch backend. """
+    if INFERENCE_BACKEND == "torch":
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16):
+            yield
+    else:
+        yield
+
+# Upper bound on summary length, in tokens
+SUMMARY_MAX_LENGTH = 50
+
+# Requests arriving within this window are batched into one forward pass
+MAX_BATCH_SIZE = 8
+BATCH_WAIT_TIMEOUT_S = 0.05
+
+@serve.deployment(num_replicas=1, ray_actor_options={"num_cpus": 4})
+class Analyzer:
+    """ Serves batched summarization and sentiment analysis. """
+
+    def __init__(self):
+        self.summarizer = load_pipeline(
+            "summarization",
+            ORTModelForSeq2SeqLM,
+            "sshleifer/distilbart-cnn-12-6",
+            revision="a4f8f3e"
+        )
+        self.sentiment_analyzer = load_pipeline(
+            "sentiment-analysis",
+            ORTModelForSequenceClassification,
+            "distilbert-base-uncased-finetuned-sst-2-english",
+            revision="714eb0f"
+        )
+        self.warm_up()
+
+    def warm_up(self):
+        """
+        Runs throwaway inputs through both models so the first real request doesn't pay for
+        kernel selection, allocator warm-up, and (on the torch backend) graph compilation.
+        """
+        # Two input lengths so torch.compile specializes both a short and a long shape
+        for words in (40, 200):
+            with inference_context():
+                self.summarizer("warmup " * words, max_length=SUMMARY_MAX_LENGTH, min_length=25, do_sample=False)
+                self.sentiment_analyzer("warmup " * words)
+
+    @serve.batch(max_batch_size=MAX_BATCH_SIZE, batch_wait_timeout_s=BATCH_WAIT_TIMEOUT_S)
+    async def summarize(self, texts):
+        """ Summarizes a batch of texts; callers send one text and receive one summary. """
+        summaries = await asyncio.to_thread(self.run_summarizer, texts)
+        return [summary['summary_text'] for summary in summaries]
+
+    @serve.batch(max_batch_size=MAX_BATCH_SIZE, batch_wait_timeout_s=BATCH_WAIT_TIMEOUT_S)
+    async def sentiment(self, texts):
+        """ Analyzes the sentiment of a batch of texts; callers send one text and receive one result. """
+        return await asyncio.to_thread(self.run_sentiment_analyzer, texts)
+
+    # The pipelines block for the length of a forward pass, so the batch handlers run them in worker threads.
+    # That keeps the replica's event loop free to collect the next batch and to overlap the two models.
+
+    def run_summarizer(self, texts):
+        """ Runs the summarization pipeline on a list of texts. """
+        with inference_context():
+            return self.summarizer(texts, max_length=SUMMARY_MAX_LENGTH, min_length=25, do_sample=False, batch_size=len(texts))
+
+    def run_sentiment_analyzer(self, texts):
+        """ Runs the sentiment-analysis pipeline on a list of texts. """
+        with inference_context():
+            return self.sentiment_analyzer(texts, batch_size=len(texts))
+
+app = Analyzer.bind()
@@ -1,107 +1,214 @@
 import os
+import re
+import logging
+import json
+import asyncio
+import aiohttp
+import ray
+from datetime import timedelta
+from async_lru import alru_cache
+from cachier import cachier
 from dotenv import load_dotenv
-from googleapiclient.discovery import build
-from transformers import pipeline
-from flask import Flask, request, render_template
+from ray import serve
+from ray.serve.exceptions import RayServeException
+from quart import Quart, Response, request, render_template
 
 # Load environment variables from .env file
 load_dotenv()
 
+# Logging setup
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+log = logging.getLogger(__name__)
+
 # Get the API key from environment variables
 API_KEY = os.getenv("YOUTUBE_API_KEY")
 
-# Initialize YouTube API client
-youtube = build("youtube", "v3", developerKey=API_KEY)
+# YouTube Data API REST endpoint
+YOUTUBE_API_URL = "https://www.googleapis.com/youtube/v3"
 
-# Initialize AI features
-summarizer = pipeline(
-    "summarization",
-    model="sshleifer/distilbart-cnn-12-6",
-    revision="a4f8f3e"
-)
-sentiment_analyzer = pipeline(
-    "sentiment-analysis",
-    model="distilbert-base-uncased-finetuned-sst-2-english",
-    revision="714eb0f"
+# Shared HTTP session so YouTube API calls reuse pooled keep-alive connections across requests;
+# opened once the server's event loop is running (see open_youtube_session)
+youtube_session = None
+
+# Matches the supported YouTube URL formats: video, channel ID, user, and handle URLs
+YOUTUBE_URL_PATTERN = re.compile(
+    r"youtube\.com/(?:watch\?v=(?P<video_id>[^&]+)"
+    r"|channel/(?P<channel_id>[^/?&]+)"
+    r"|user/(?P<username>[^/?&]+)"
+    r"|@(?P<handle>[^/?&]+))"
 )
 
-# Flask App Setup
-app = Flask(__name__)
+# How long cached YouTube API results stay fresh
+CHANNEL_CACHE_TTL = timedelta(hours=6)
+VIDEO_CACHE_TTL = timedelta(minutes=5)
+
+# Name of the Ray Serve application hosting the models (see inference_service.py)
+INFERENCE_APP_NAME = "inference"
+
+# Handle to the inference service; connected once the server starts (see connect_analyzer)
+analyzer = None
+
+# Inputs are cut to these lengths before inference so long texts don't inflate tokenization and attention cost
+SUMMARY_MAX_CHARS = 3000
+SENTIMENT_MAX_CHARS = 512
+
+# Texts of at most this many words are returned as-is, since a summary would be about as long
+SUMMARY_SKIP_WORDS = 40
+
+# Quart App Setup
+app = Quart(__name__)
+
+@app.before_serving
+async def open_youtube_session():
+    global youtube_session
+    youtube_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=10),
+        timeout=aiohttp.ClientTimeout(total=10)
+    )
+
+@app.before_serving
+async def connect_analyzer():
+    global analyzer
+    # Connecting to Ray blocks, so keep it off the event loop
+    analyzer = await asyncio.to_thread(get_analyzer)
+
+@app.after_serving
+async def close_youtube_session():
+    await youtube_session.close()
 
 @app.route("/", methods=["GET", "POST"])
-def index():
+async def index():
     if request.method == "POST":
-        url = request.form["url"]
-        channel_id = resolve_channel_id(url)
+        url = (await request.form)["url"]
+        channel_id = await resolve_channel_id(url)
         if channel_id:
-            channel_data = fetch_channel_data(channel_id)
-            video_data = fetch_latest_video_details(channel_id)
-            return render_template("result.html", channel_data=channel_data, video_data=video_data)
+            # The page fills itself in from the /stream events as results become ready
+            return await render_template("result.html", channel_id=channel_id)
         else:
-            return render_template("index.html", error="Invalid YouTube URL")
-    return render_template("index.html")
+            return await render_template("index.html", error="Invalid YouTube URL")
+    return await render_template("index.html")
 
-def resolve_channel_id(url):
+@app.route("/stream/<channel_id>")
+async def stream(channel_id):
+    """ Streams the channel, video, and comment analysis for a channel as server-sent events. """
+    response = Response(analysis_events(channel_id), mimetype="text/event-stream")
+    # Model calls can keep the stream open longer than Quart's default response timeout
+    response.timeout = None
+    return response
+
+def server_sent_event(event, data):
+    """ Formats a named server-sent event with a JSON payload. """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+async def analysis_events(channel_id):
+    """
+    Yields server-sent events as each part of the analysis completes:
+    the channel, the latest video, the video description analysis, and each analyzed comment.
+    """
+    # The channel and video lookups are independent, so run them concurrently
+    channel_task = asyncio.create_task(fetch_channel_data(channel_id))
+    video_task = asyncio.create_task(fetch_latest_video(channel_id))
+    pending = {}
+    try:
+        yield server_sent_event("channel", await channel_task)
+        video = await video_task
+        yield server_sent_event("video", video)
+
+        if video:
+            # Analyze the description while fetching comments, then stream results in completion order
+            pending[asyncio.create_task(analyze_description(video["description"]))] = "description"
+            for comment in await fetch_comments(video["video_id"]) or []:
+                pending[asyncio.create_task(analyze_comment(comment))] = "comment"
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield server_sent_event(pending.pop(task), task.result())
+
+        yield server_sent_event("done", None)
+    finally:
+        # Stop outstanding work if the client disconnects mid-stream
+        for task in (channel_task, video_task, *pending):
+            task.cancel()
+
+def get_analyzer():
+    """
+    Connects to the running Ray cluster and returns a handle to the inference service.
+    Each server worker process calls this at startup to open its own Ray connection.
+    """
+    ray.init(address=os.getenv("RAY_ADDRESS", "auto"), ignore_reinit_error=True)
+    try:
+        return serve.get_app_handle(INFERENCE_APP_NAME)
+    except RayServeException as e:
+        raise RuntimeError(
+            f"Ray Serve application '{INFERENCE_APP_NAME}' is not running; "
+            f"start it with: serve run --name {INFERENCE_APP_NAME} inference_service:app"
+        ) from e
+
+async def youtube_get(resource, **params):
+    """ Issues a GET request against the YouTube Data API and returns the decoded JSON response. """
+    async with youtube_session.get(f"{YOUTUBE_API_URL}/{resource}", params={**params, "key": API_KEY}) as response:
+        response.raise_for_status()
+        return await response.json()
+
+async def resolve_channel_id(url):
     """
     Resolves the channel ID from the given YouTube URL.
     Supports channel, user, handle, and video URLs.
     """
     try:
-        if "youtube.com/watch?v=" in url:  # Video URL
-            video_id = url.split("v=")[-1].split("&")[0]
-            return get_channel_from_video(video_id)
-        elif "youtube.com/channel/" in url:  # Channel ID URL
-            return url.split("/channel/")[-1].strip()
-        elif "youtube.com/user/" in url:  # User URL
-            username = url.split("/user/")[-1].strip()
-            return get_channel_from_username(username)
-        elif "youtube.com/@" in url:  # Handle URL
-            handle = url.split("@")[-1].strip()
-            return get_channel_from_handle(handle)
-        else:
+        match = YOUTUBE_URL_PATTERN.search(url.strip())
+        if not match:
             raise ValueError("Invalid YouTube URL format.")
+        if match["video_id"]:  # Video URL
+            return await get_channel_from_video(match["video_id"])
+        elif match["channel_id"]:  # Channel ID URL
+            return match["channel_id"]
+        elif match["username"]:  # User URL
+            return await get_channel_from_username(match["username"])
+        else:  # Handle URL
+            return await get_channel_from_handle(match["handle"])
     except Exception as e:
-        print(f"Error resolving channel ID: {e}")
+        log.warning("Error resolving channel ID: %s", e)
         return None
 
-def get_channel_from_video(video_id):
+@cachier(stale_after=CHANNEL_CACHE_TTL)
+async def get_channel_from_video(video_id):
     """ Resolves the channel ID from a video ID. """
     try:
-        request = youtube.videos().list(part="snippet", id=video_id)
-        response = request.execute()
+        response = await youtube_get("videos", part="snippet", id=video_id)
         if response["items"]:
             return response["items"][0]["snippet"]["channelId"]
     except Exception as e:
-        print(f"Error fetching channel ID from video: {e}")
+        log.warning("Error fetching channel ID from video: %s", e)
     return None
 
-def get_channel_from_username(username):
+@cachier(stale_after=CHANNEL_CACHE_TTL)
+async def get_channel_from_username(username):
     """ Resolves the channel ID from a username. """
     try:
-        request = youtube.channels().list(part="id", forUsername=username)
-        response = request.execute()
+        response = await youtube_get("channels", part="id", forUsername=username)
         if response["items"]:
             return response["items"][0]["id"]
     except Exception as e:
-        print(f"Error fetching channel ID from username: {e}")
+        log.warning("Error fetching channel ID from username: %s", e)
     return None
 
-def get_channel_from_handle(handle):
+@cachier(stale_after=CHANNEL_CACHE_TTL)
+async def get_channel_from_handle(handle):
     """ Resolves the channel ID from a handle. """
     try:
-        request = youtube.search().list(part="snippet", type="channel", q=f"@{handle}", maxResults=1)
-        response = request.execute()
+        response = await youtube_get("channels", part="id", forHandle=f"@{handle}")
         if response["items"]:
-            return response["items"][0]["snippet"]["channelId"]
+            return response["items"][0]["id"]
     except Exception as e:
-        print(f"Error fetching channel ID from handle: {e}")
+        log.warning("Error fetching channel ID from handle: %s", e)
     return None
 
-def fetch_channel_data(channel_id):
+@cachier(stale_after=CHANNEL_CACHE_TTL)
+async def fetch_channel_data(channel_id):
     """ Fetches basic information about the channel. """
     try:
-        request = youtube.channels().list(part="snippet,statistics", id=channel_id)
-        response = request.execute()
+        response = await youtube_get("channels", part="snippet,statistics", id=channel_id)
         if response["items"]:
             channel = response["items"][0]
             title = channel["snippet"]["title"]
@@ -116,101 +223,106 @@ def fetch_channel_data(channel_id):
                 "views": views
             }
         else:
-            print("Channel not found.")
+            log.warning("Channel not found.")
             return None
     except Exception as e:
-        print(f"Error fetching channel data: {e}")
+        log.warning("Error fetching channel data: %s", e)
         return None
 
-def fetch_latest_video_details(channel_id):
-    """ Fetches the latest video details for a given channel ID. """
+@cachier(stale_after=VIDEO_CACHE_TTL)
+async def fetch_latest_video(channel_id):
+    """ Fetches the latest video for a given channel ID. """
     try:
-        request = youtube.search().list(
-            part="snippet",
-            channelId=channel_id,
-            order="date",
+        # The channel's uploads playlist ("UC..." -> "UU...") lists its newest video first
+        response = await youtube_get(
+            "playlistItems",
+            part="snippet,contentDetails",
+            playlistId="UU" + channel_id[2:],
             maxResults=1
         )
-        response = request.execute()
         if response["items"]:
             video = response["items"][0]
-            video_id = video["id"]["videoId"]
-            title = video["snippet"]["title"]
-            description = video["snippet"]["description"]
-            published_at = video["snippet"]["publishedAt"]
-
-            summarized_description = summarize_text(description)
-            sentiment = analyze_sentiment(description)
-
-            # Fetch and analyze comments for the latest video
-            comments = fetch_comments(video_id)
-
             return {
-                "video_id": video_id,
-                "title": title,
-                "description": description,
-                "published_at": published_at,
-                "summarized_description": summarized_description,
-                "sentiment": sentiment,
-                "comments": comments  # Include comments in the result
+                "video_id": video["contentDetails"]["videoId"],
+                "title": video["snippet"]["title"],
+                "description": video["snippet"]["description"],
+                # videoPublishedAt is missing for private and scheduled videos
+                "published_at": video["contentDetails"].get("videoPublishedAt", video["snippet"]["publishedAt"])
             }
         else:
-            print("No videos found for this channel.")
+            log.warning("No videos found for this channel.")
             return None
     except Exception as e:
-        print(f"Error fetching latest video details: {e}")
+        log.warning("Error fetching latest video: %s", e)
         return None
 
-def fetch_comments(video_id):
+@cachier(stale_after=VIDEO_CACHE_TTL)
+async def fetch_comments(video_id):
     """ Fetches the top 5 comments for a given video ID. """
     try:
-        request = youtube.commentThreads().list(
+        response = await youtube_get(
+            "commentThreads",
             part="snippet",
             videoId=video_id,
             maxResults=5
         )
-        response = request.execute()
-        comments_data = []
-        if response["items"]:
-            for comment in response["items"]:
-                author = comment["snippet"]["topLevelComment"]["snippet"]["authorDisplayName"]
-                text = comment["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
-                
-                # Summarize and analyze sentiment of the comment
-                summarized_comment = summarize_text(text)
-                sentiment = analyze_sentiment(text)
-
-                comments_data.append({
-                    "author": author,
-                    "text": text,
-                    "summarized_comment": summarized_comment,
-                    "sentiment": sentiment
-                })
-        else:
-            comments_data.append({"author": "No comments", "text": "No comments available."})
-        
-        return comments_data
+        return [
+            {
+                "author": comment["snippet"]["topLevelComment"]["snippet"]["authorDisplayName"],
+                "text": comment["snippet"]["topLevelComment"]["snippet"]["textDisplay"]
+            }
+            for comment in response["items"]
+        ]
     except Exception as e:
-        print(f"Error fetching comments: {e}")
-        return []
+        # None is not cached by cachier, so the lookup is retried on the next request
+        log.warning("Error fetching comments: %s", e)
+        return None
+
+async def analyze_description(description):
+    """ Summarizes and analyzes the sentiment of a video description. """
+    summarized_description, sentiment = await asyncio.gather(
+        summarize_text(description),
+        analyze_sentiment(description)
+    )
+    return {"summarized_description": summarized_description, "sentiment": sentiment}
+
+async def analyze_comment(comment):
+    """ Summarizes and analyzes the sentiment of a comment; concurrent comments are batched by the inference service. """
+    summarized_comment, sentiment = await asyncio.gather(
+        summarize_text(comment["text"]),
+        analyze_sentiment(comment["text"])
+    )
+    return {**comment, "summarized_comment": summarized_comment, "sentiment": sentiment}
 
-def summarize_text(text):
-    """ Summarizes the given text using the Hugging Face summarization pipeline. """
+async def summarize_text(text):
+    """ Summarizes the given text using the inference service's summarization model. """
+    if not text:
+        return ""
+    n_words = text.count(" ") + 1
+    if n_words <= SUMMARY_SKIP_WORDS:
+        return text
     try:
-        summary = summarizer(text, max_length=50, min_length=25, do_sample=False)
-        return summary[0]['summary_text']
+        return await request_summary(text[:SUMMARY_MAX_CHARS])
     except Exception as e:
-        print(f"Error during summarization: {e}")
+        log.warning("Error during summarization: %s", e)
         return None
 
-def analyze_sentiment(text):
-    """ Analyzes the sentiment of the given text using the Hugging Face sentiment-analysis pipeline. """
+async def analyze_sentiment(text):
+    """ Analyzes the sentiment of the given text using the inference service's sentiment-analysis model. """
     try:
-        sentiment = sentiment_analyzer(text)
-        return sentiment[0]
+        return await request_sentiment(text[:SENTIMENT_MAX_CHARS])
     except Exception as e:
-        print(f"Error during sentiment analysis: {e}")
+        log.warning("Error during sentiment analysis: %s", e)
         return None
 
-if __name__ == "__main__":
-    app.run(debug=True)
+# The memoized inference calls raise on failure so errors are never cached
+
+@alru_cache(maxsize=1024)
+async def request_summary(text):
+    """ Requests a summary of the given text from the inference service. """
+    return await analyzer.summarize.remote(text)
+
+@alru_cache(maxsize=1024)
+async def request_sentiment(text):
+    """ Requests the sentiment of the given text from the inference service. """
+    return await analyzer.sentiment.remote(text)